@@ -1,10 +1,17 @@
 import os
 import logging
+import numpy as np
+import orjson
 import pandas as pd
 import json
-import re
-from flask import Flask, render_template, request, jsonify
-from openai_service import generate_pandas_code
+import ast
+import builtins
+import datetime
+import functools
+from flask import Flask, Response, render_template, request
+from openai_service import TEMPLATE_IDS, generate_pandas_code
+from data_loader import DERIVED_COLUMNS, load_sales_data
+from kernels import groupby_sum_count, groupby_sum_count_masked
 
 # Set up logging
 logging.basicConfig(level=logging.DEBUG)
@@ -13,97 +20,261 @@ logging.basicConfig(level=logging.DEBUG)
 app = Flask(__name__)
 app.secret_key = os.environ.get("SESSION_SECRET", "dev-secret-key")
 
+ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+def json_default(obj):
+    """Serialize the pandas/numpy values orjson does not handle natively."""
+    if obj is pd.NaT or obj is pd.NA:
+        return None
+    if isinstance(obj, pd.Timestamp):
+        return obj.isoformat()
+    if isinstance(obj, (pd.Period, pd.Timedelta)):
+        return str(obj)
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+def dumps(obj):
+    """Serialize to JSON bytes with orjson."""
+    return orjson.dumps(obj, default=json_default, option=ORJSON_OPTIONS)
+
+def ojsonify(obj, status=200):
+    """orjson-backed replacement for flask.jsonify."""
+    return Response(dumps(obj), status=status, mimetype='application/json')
+
+# Serialized template results keyed on (template id, data version)
+result_cache = {}
+data_version = 0
+
+def build_data_info(df, columns):
+    """Summarize the loaded dataset for the /data-info endpoint."""
+    return {
+        'columns': columns,
+        'row_count': len(df),
+        'sample_data': df[columns].head(5).to_dict('records'),
+        'date_range': {
+            'start': df['date'].min().isoformat(),
+            'end': df['date'].max().isoformat()
+        },
+        # Categories are the distinct regions already, no scan over the rows needed
+        'regions': df['region'].cat.categories.tolist() if 'region' in df.columns else []
+    }
+
+def reload_sales_data():
+    """
+    (Re)load the sales data and invalidate results cached for the previous version.
+    """
+    global sales_data, data_columns, data_info_json, data_version
+    try:
+        sales_data = load_sales_data()
+        data_columns = [c for c in sales_data.columns if c not in DERIVED_COLUMNS]
+        # /data-info only changes with the data, so serialize it once per load
+        data_info_json = dumps(build_data_info(sales_data, data_columns))
+    except Exception as e:
+        logging.error(f"Failed to load sales data: {e}")
+        sales_data = None
+        data_columns = []
+        data_info_json = None
+    data_version += 1
+    result_cache.clear()
+
 # Load the sales data once at startup
-try:
-    # Try to load from same directory first, then parent directory
-    csv_path = 'sales.csv'
-    if not os.path.exists(csv_path):
-        csv_path = os.path.join(os.path.dirname(__file__), 'sales.csv')
-    
-    sales_data = pd.read_csv(csv_path)
-    sales_data['date'] = pd.to_datetime(sales_data['date'])
-    logging.info(f"Loaded sales data with {len(sales_data)} rows from {csv_path}")
-except Exception as e:
-    logging.error(f"Failed to load sales.csv: {e}")
-    sales_data = None
-
-def is_safe_code(code):
+reload_sales_data()
+
+# The only builtins generated code can reach; everything else raises NameError
+ALLOWED_BUILTINS = {
+    'abs', 'all', 'any', 'bool', 'dict', 'enumerate', 'float', 'int', 'len', 'list',
+    'max', 'min', 'range', 'round', 'set', 'sorted', 'str', 'sum', 'tuple', 'zip',
+}
+
+# Names generated code may read besides the variables it assigns itself
+ALLOWED_NAMES = {'df', 'pd', 'datetime', 'result'} | ALLOWED_BUILTINS
+
+# Attributes that reach file/system access or pandas internals
+BLOCKED_ATTRIBUTES = {
+    'api', 'compat', 'core', 'io', 'plotting', 'testing', 'util',
+    'builtins', 'os', 'pickle', 'popen', 'shutil', 'subprocess', 'sys', 'system',
+    'set_option', 'options', 'show_versions',
+    # pandas evaluates these expression strings itself, out of the validator's sight
+    'eval', 'query',
+    'to_clipboard', 'to_csv', 'to_excel', 'to_feather', 'to_gbq', 'to_hdf', 'to_html',
+    'to_json', 'to_latex', 'to_markdown', 'to_orc', 'to_parquet', 'to_pickle', 'to_sql',
+    'to_stata', 'to_string', 'to_xml',
+    # numpy array and pandas writer objects that take a file path
+    'dump', 'dumps', 'tofile', 'ExcelWriter', 'HDFStore',
+    # Styler and plotting accessors, which can export or save figures
+    'style', 'plot', 'hist', 'boxplot', 'savefig',
+    # str.format can walk attributes of its arguments from inside the format string
+    'format', 'format_map',
+}
+
+# Statements generated code has no reason to contain
+BLOCKED_NODES = (
+    ast.Import, ast.ImportFrom, ast.Global, ast.Nonlocal,
+    ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef,
+)
+
+# Modules available to generated code; copied per execution. An explicit
+# __builtins__ stops exec from supplying the real builtins module, so a name the
+# validator let through (e.g. bound only in a branch that never runs) cannot
+# fall back to eval, open and friends.
+BASE_NAMESPACE = {
+    '__builtins__': {name: getattr(builtins, name) for name in ALLOWED_BUILTINS},
+    'pd': pd,
+    'datetime': datetime,
+}
+
+class SafeCodeValidator(ast.NodeVisitor):
     """
-    Basic safety check for generated pandas code.
-    Prevents dangerous operations like file system access, imports, etc.
+    Whitelist check over the AST of generated pandas code.
+    Raises ValueError on imports, definitions, unknown or private names,
+    private or blocked attributes, and strings naming such attributes.
     """
-    dangerous_patterns = [
-        r'import\s+(?!pandas|numpy|datetime)',
-        r'from\s+(?!pandas|numpy|datetime)',
-        r'open\s*\(',
-        r'exec\s*\(',
-        r'eval\s*\(',
-        r'__import__',
-        r'getattr',
-        r'setattr',
-        r'delattr',
-        r'globals\s*\(',
-        r'locals\s*\(',
-        r'dir\s*\(',
-        r'vars\s*\(',
-        r'\.system',
-        r'os\.',
-        r'subprocess',
-        r'shutil',
-        r'pickle',
-    ]
     
-    for pattern in dangerous_patterns:
-        if re.search(pattern, code, re.IGNORECASE):
-            return False
-    return True
+    def __init__(self, tree):
+        # Variables, lambda arguments and comprehension targets bound by the code itself
+        self.names = set(ALLOWED_NAMES)
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Store):
+                self.names.add(node.id)
+            elif isinstance(node, ast.arg):
+                self.names.add(node.arg)
+    
+    def generic_visit(self, node):
+        if isinstance(node, BLOCKED_NODES):
+            raise ValueError(f"{type(node).__name__} is not allowed")
+        super().generic_visit(node)
+    
+    def visit_Name(self, node):
+        if node.id.startswith('_') or node.id not in self.names:
+            raise ValueError(f"name '{node.id}' is not allowed")
+    
+    def visit_Attribute(self, node):
+        if node.attr.startswith(('_', 'read_')) or node.attr in BLOCKED_ATTRIBUTES:
+            raise ValueError(f"attribute '{node.attr}' is not allowed")
+        self.generic_visit(node)
+    
+    def visit_Constant(self, node):
+        # agg/apply/transform look methods up by name, e.g. df.agg('to_pickle', path=...)
+        if isinstance(node.value, str) and (
+                node.value.startswith(('_', 'to_', 'read_')) or node.value in BLOCKED_ATTRIBUTES):
+            raise ValueError(f"string '{node.value}' is not allowed")
+
+@functools.lru_cache(maxsize=512)
+def compile_safe_code(code):
+    """
+    Parse and validate generated pandas code, returning the compiled code object.
+    The validated tree is compiled directly so the source is only parsed once,
+    and code objects are memoized so repeated code skips parsing entirely.
+    Raises ValueError for unsafe code and SyntaxError for invalid code.
+    """
+    tree = ast.parse(code, mode='exec')
+    SafeCodeValidator(tree).visit(tree)
+    return compile(tree, '<generated>', 'exec')
+
+def region_sales(df, how, mask=None):
+    """
+    Sales per region computed with the groupby_sum_count kernels.
+    Equivalent to df.groupby("region", observed=True)["sales"].<how>().reset_index(),
+    or to the same on df[mask] without building the filtered frame.
+    """
+    region = df['region']
+    codes = region.cat.codes.to_numpy()
+    values = df['sales'].to_numpy(dtype='float64')
+    ngroups = len(region.cat.categories)
+    if mask is None:
+        sums, counts, sizes = groupby_sum_count(codes, values, ngroups)
+    else:
+        sums, counts, sizes = groupby_sum_count_masked(codes, values, mask, ngroups)
+    # A region is observed if it has rows, even if all their sales are NaN:
+    # its sum is then 0.0 and its mean NaN, as in pandas
+    observed = sizes > 0
+    if how == 'sum':
+        values = sums[observed]
+    else:
+        with np.errstate(invalid='ignore'):
+            values = sums[observed] / counts[observed]
+    return pd.DataFrame({'region': region.cat.categories[observed], 'sales': values})
+
+def monthly_sales(df):
+    """Total sales per calendar month with the period rendered as a string."""
+    result = df.groupby("_period_M")["sales"].sum().reset_index().rename(columns={"_period_M": "date"})
+    result["date"] = result["date"].astype(str)
+    return result
+
+# Template id -> direct implementation of the template code, so vetted
+# templates skip the safety check and exec. Each entry must stay equivalent
+# to the 'code' of the matching pattern in QUERY_PATTERNS (tests/test_templates.py).
+TEMPLATE_HANDLERS = {
+    'sales_by_region': lambda df: region_sales(df, 'sum'),
+    'sales_by_month': monthly_sales,
+    'average_sales_by_region': lambda df: region_sales(df, 'mean'),
+    'top_sales': lambda df: df.nlargest(10, "sales")[["date", "region", "sales"]],
+    'sales_in_july': lambda df: df[df["_month"] == 7],
+    'sales_in_2023': lambda df: df[df["_year"] == 2023],
+    'total_sales': lambda df: df["sales"].sum(),
+    'record_count': lambda df: len(df),
+    'average_daily_sales': lambda df: df.groupby("date")["sales"].sum().mean(),
+    'sales_by_region_2023': lambda df: region_sales(df, 'sum', df["_year"].to_numpy() == 2023),
+    'preview': lambda df: df.head(10),
+}
+
+def serialize_result(result):
+    """Convert a query result to JSON-serializable format."""
+    if isinstance(result, pd.DataFrame):
+        result = result.drop(columns=[c for c in DERIVED_COLUMNS if c in result.columns])
+        # Column-oriented: one value list per column instead of one dict per row
+        return {
+            'type': 'dataframe',
+            'data': [result.iloc[:, i].tolist() for i in range(result.shape[1])],
+            'columns': result.columns.tolist()
+        }
+    elif isinstance(result, pd.Series):
+        return {
+            'type': 'series',
+            'data': result.to_dict(),
+            'name': result.name
+        }
+    elif isinstance(result, (int, float, str, bool, np.number, np.bool_)):
+        return {
+            'type': 'scalar',
+            'data': result
+        }
+    else:
+        return {
+            'type': 'other',
+            'data': str(result)
+        }
 
 def execute_pandas_code(code, df):
     """
     Safely execute pandas code on the dataframe.
+    Known template code runs through TEMPLATE_HANDLERS instead of exec.
     Returns the result and any error messages.
     """
-    if not is_safe_code(code):
-        return None, "Generated code contains unsafe operations"
+    handler = TEMPLATE_HANDLERS.get(TEMPLATE_IDS.get(code))
     
     try:
-        # Create a restricted namespace with only necessary modules
-        namespace = {
-            'df': df,
-            'pd': pd,
-            'datetime': __import__('datetime'),
-        }
+        if handler is not None:
+            return serialize_result(handler(df)), None
+        
+        try:
+            code_obj = compile_safe_code(code)
+        except ValueError as e:
+            return None, f"Generated code contains unsafe operations: {e}"
         
-        # Execute the code
-        exec(code, namespace)
+        # Create a restricted namespace with only necessary modules. Generated
+        # code sees the columns it was prompted with; the helper columns are
+        # for TEMPLATE_HANDLERS only (the selection shares data under copy-on-write)
+        namespace = BASE_NAMESPACE.copy()
+        namespace['df'] = df[data_columns]
+        
+        # Execute the validated code object
+        exec(code_obj, namespace)
         
         # The code should assign result to 'result' variable
         if 'result' in namespace:
-            result = namespace['result']
-            
-            # Convert result to JSON-serializable format
-            if isinstance(result, pd.DataFrame):
-                return {
-                    'type': 'dataframe',
-                    'data': result.to_dict('records'),
-                    'columns': result.columns.tolist()
-                }, None
-            elif isinstance(result, pd.Series):
-                return {
-                    'type': 'series',
-                    'data': result.to_dict(),
-                    'name': result.name
-                }, None
-            elif isinstance(result, (int, float, str, bool)):
-                return {
-                    'type': 'scalar',
-                    'data': result
-                }, None
-            else:
-                return {
-                    'type': 'other',
-                    'data': str(result)
-                }, None
+            return serialize_result(namespace['result']), None
         else:
             return None, "Generated code did not produce a 'result' variable"
             
@@ -115,6 +286,12 @@ def index():
     """Render the main dashboard page."""
     return render_template('index.html')
 
+def ask_response(result_json, code, query):
+    """Build the /ask success response around an already serialized result."""
+    body = b'{"success":true,"result":%b,"generated_code":%b,"query":%b}' % (
+        result_json, dumps(code), dumps(query))
+    return Response(body, mimetype='application/json')
+
 @app.route('/ask', methods=['POST'])
 def ask():
     """
@@ -123,59 +300,56 @@ def ask():
     try:
         data = request.get_json()
         if not data or 'query' not in data:
-            return jsonify({'error': 'No query provided'}), 400
+            return ojsonify({'error': 'No query provided'}, 400)
         
         query = data['query'].strip()
         if not query:
-            return jsonify({'error': 'Empty query provided'}), 400
+            return ojsonify({'error': 'Empty query provided'}, 400)
         
         if sales_data is None:
-            return jsonify({'error': 'Sales data not available'}), 500
+            return ojsonify({'error': 'Sales data not available'}, 500)
         
-        logging.info(f"Processing query: {query}")
-        
-        # Generate pandas code using OpenAI
-        code, error = generate_pandas_code(query, sales_data.columns.tolist())
+        # Generate pandas code using OpenAI (repeated queries are served from cache)
+        code, error = generate_pandas_code(query, data_columns)
         
         if error:
-            return jsonify({'error': f'Failed to generate code: {error}'}), 500
+            return ojsonify({'error': f'Failed to generate code: {error}'}, 500)
         
-        logging.info(f"Generated code: {code}")
+        # Lazy %-formatting so disabled log levels cost nothing on cache hits
+        logging.info("Processing query: %s", query)
+        logging.info("Generated code: %s", code)
         
-        # Execute the generated code
-        result, exec_error = execute_pandas_code(code, sales_data)
+        # Template results only change with the data, so reuse their serialized form
+        template_id = TEMPLATE_IDS.get(code)
+        cache_key = (template_id, data_version)
+        result_json = result_cache.get(cache_key) if template_id else None
         
-        if exec_error:
-            return jsonify({'error': exec_error}), 500
+        if result_json is None:
+            # Execute the generated code
+            result, exec_error = execute_pandas_code(code, sales_data)
+            
+            if exec_error:
+                return ojsonify({'error': exec_error}, 500)
+            
+            result_json = dumps(result)
+            if template_id:
+                result_cache[cache_key] = result_json
         
         # Return successful result
-        return jsonify({
-            'success': True,
-            'result': result,
-            'generated_code': code,
-            'query': query
-        })
+        return ask_response(result_json, code, query)
         
     except Exception as e:
         logging.error(f"Unexpected error in /ask endpoint: {e}")
-        return jsonify({'error': 'Internal server error'}), 500
+        return ojsonify({'error': 'Internal server error'}, 500)
 
 @app.route('/data-info')
 def data_info():
     """Return information about the loaded dataset."""
-    if sales_data is None:
-        return jsonify({'error': 'Sales data not available'}), 500
+    if data_info_json is None:
+        return ojsonify({'error': 'Sales data not available'}, 500)
     
-    return jsonify({
-        'columns': sales_data.columns.tolist(),
-        'row_count': len(sales_data),
-        'sample_data': sales_data.head(5).to_dict('records'),
-        'date_range': {
-            'start': sales_data['date'].min().isoformat(),
-            'end': sales_data['date'].max().isoformat()
-        },
-        'regions': sales_data['region'].unique().tolist() if 'region' in sales_data.columns else []
-    })
+    return Response(data_info_json, mimetype='application/json')
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    # Debugger and reloader only in development; use gunicorn.conf.py in production
+    app.run(host='0.0.0.0', port=5000, debug=os.environ.get('FLASK_ENV') == 'development')
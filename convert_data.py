@@ -0,0 +1,31 @@
+#!/usr/bin/env python3
+"""
+Convert sales.csv into sales.parquet and sales.arrow
+One-shot script; rerun whenever the CSV changes
+"""
+
+import os
+
+import pyarrow as pa
+
+from data_loader import find_data_file, read_csv_data
+
+if __name__ == '__main__':
+    csv_path = find_data_file('sales.csv')
+    if not csv_path:
+        raise SystemExit("sales.csv not found")
+
+    data_dir = os.path.dirname(csv_path)
+    parquet_path = os.path.join(data_dir, 'sales.parquet')
+    arrow_path = os.path.join(data_dir, 'sales.arrow')
+    df = read_csv_data(csv_path)
+
+    df.to_parquet(parquet_path, compression='zstd', index=False)
+    print(f"Wrote {len(df)} rows from {csv_path} to {parquet_path}")
+
+    # Uncompressed Arrow IPC so workers can memory-map it; categoricals become dictionary arrays
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    with pa.OSFile(arrow_path, 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    print(f"Wrote {len(df)} rows from {csv_path} to {arrow_path}")
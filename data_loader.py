@@ -0,0 +1,97 @@
+import os
+import logging
+import pandas as pd
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Helper columns precomputed at load time; hidden from the LLM and from results
+DERIVED_COLUMNS = ['_year', '_month', '_period_M']
+
+# Low-cardinality text columns stored as categoricals so groupby works on integer codes
+CATEGORICAL_COLUMNS = ('region',)
+
+def find_data_file(filename):
+    """Return the path of a data file in the working directory or next to this module."""
+    if os.path.exists(filename):
+        return filename
+    path = os.path.join(BASE_DIR, filename)
+    return path if os.path.exists(path) else None
+
+def set_dtypes(df):
+    """Convert raw CSV columns to the dtypes the queries expect."""
+    df['date'] = pd.to_datetime(df['date'])
+    for col in CATEGORICAL_COLUMNS:
+        values = df[col].astype('category')
+        # Sorted categories keep grouped output alphabetical whatever reader built them
+        df[col] = values.cat.reorder_categories(sorted(values.cat.categories))
+    return df
+
+def read_csv_data(csv_path):
+    """
+    Parse the sales CSV and apply column dtypes.
+    Uses pyarrow's multithreaded reader, which parses dates and dictionary-encodes
+    categoricals while reading; falls back to pandas when pyarrow is not installed.
+    """
+    try:
+        import pyarrow as pa
+        from pyarrow import csv as pacsv
+    except ImportError:
+        return set_dtypes(pd.read_csv(csv_path))
+
+    column_types = {'date': pa.timestamp('ns'), 'sales': pa.float64()}
+    for col in CATEGORICAL_COLUMNS:
+        column_types[col] = pa.dictionary(pa.int32(), pa.string())
+    table = pacsv.read_csv(csv_path, convert_options=pacsv.ConvertOptions(column_types=column_types))
+    # set_dtypes is a no-op here; it keeps the result identical to the pandas path
+    return set_dtypes(table.to_pandas(self_destruct=True))
+
+def add_derived_columns(df):
+    """Extract date parts once instead of through the .dt accessor on every query."""
+    df['_year'] = df['date'].dt.year.astype('int16')
+    df['_month'] = df['date'].dt.month.astype('int8')
+    df['_period_M'] = df['date'].dt.to_period('M')
+    return df
+
+def read_arrow_data(arrow_path):
+    """
+    Memory-map an Arrow IPC file written by convert_data.py.
+    Server workers mapping the same file share its pages through the OS page
+    cache instead of each parsing a private copy.
+    """
+    import pyarrow as pa
+
+    source = pa.memory_map(arrow_path, 'r')
+    table = pa.ipc.open_file(source).read_all()
+    # split_blocks keeps numeric columns as views of the mapping instead of consolidating copies
+    return table.to_pandas(split_blocks=True)
+
+def is_fresh(path, csv_path):
+    """True if a converted data file exists and is not older than the CSV it came from."""
+    return bool(path) and (not csv_path or os.path.getmtime(path) >= os.path.getmtime(csv_path))
+
+def load_sales_data():
+    """
+    Load the sales dataset with derived columns added.
+    Prefers the memory-mapped sales.arrow, then sales.parquet (dtypes preserved,
+    no date re-parse), and falls back to sales.csv when the converted files are
+    missing or older than the CSV.
+    """
+    csv_path = find_data_file('sales.csv')
+    arrow_path = find_data_file('sales.arrow')
+    parquet_path = find_data_file('sales.parquet')
+
+    # set_dtypes is a no-op for files written by convert_data.py
+    if is_fresh(arrow_path, csv_path):
+        df = set_dtypes(read_arrow_data(arrow_path))
+        source = arrow_path
+    elif is_fresh(parquet_path, csv_path):
+        df = set_dtypes(pd.read_parquet(parquet_path))
+        source = parquet_path
+    elif csv_path:
+        df = read_csv_data(csv_path)
+        source = csv_path
+    else:
+        raise FileNotFoundError("sales.csv not found")
+
+    logging.info(f"Loaded sales data with {len(df)} rows from {source}")
+    return add_derived_columns(df)
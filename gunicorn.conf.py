@@ -0,0 +1,16 @@
+"""
+Gunicorn settings for production
+Usage: gunicorn -c gunicorn.conf.py main:app
+"""
+
+import os
+
+bind = os.environ.get('BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('WEB_CONCURRENCY', 4))
+
+# Threads overlap requests waiting on OpenAI; pandas work still runs one per worker at a time
+worker_class = 'gthread'
+threads = int(os.environ.get('THREADS', 16))
+
+# Load the dataset once in the master so workers share its pages copy-on-write
+preload_app = True
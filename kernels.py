@@ -0,0 +1,75 @@
+import logging
+import numpy as np
+
+try:
+    from numba import njit
+    # The app logs at DEBUG; keep numba's compiler dumps out of it
+    logging.getLogger('numba').setLevel(logging.WARNING)
+except ImportError:
+    njit = None
+
+def _groupby_sum_count_loop(codes, values, ngroups):
+    """
+    Per-group sum, count of non-NaN values and row count in a single pass.
+    codes are categorical codes (-1 for missing groups), values are floats.
+    Returns (sums, counts, sizes) arrays of length ngroups; sizes also counts
+    NaN rows, so a group whose values are all NaN is still present.
+    """
+    sums = np.zeros(ngroups, dtype=np.float64)
+    counts = np.zeros(ngroups, dtype=np.int64)
+    sizes = np.zeros(ngroups, dtype=np.int64)
+    for i in range(codes.shape[0]):
+        code = codes[i]
+        if code < 0:
+            continue
+        sizes[code] += 1
+        value = values[i]
+        if not np.isnan(value):
+            sums[code] += value
+            counts[code] += 1
+    return sums, counts, sizes
+
+def _groupby_sum_count_numpy(codes, values, ngroups):
+    """Vectorized equivalent of _groupby_sum_count_loop for when numba is not installed."""
+    present = codes >= 0
+    valid = present & ~np.isnan(values)
+    sums = np.bincount(codes[valid], weights=values[valid], minlength=ngroups)
+    counts = np.bincount(codes[valid], minlength=ngroups)
+    sizes = np.bincount(codes[present], minlength=ngroups)
+    return sums, counts, sizes
+
+def _groupby_sum_count_masked_loop(codes, values, mask, ngroups):
+    """
+    groupby_sum_count restricted to rows where mask is True.
+    Applies a filter during the same pass instead of materializing the filtered frame.
+    """
+    sums = np.zeros(ngroups, dtype=np.float64)
+    counts = np.zeros(ngroups, dtype=np.int64)
+    sizes = np.zeros(ngroups, dtype=np.int64)
+    for i in range(codes.shape[0]):
+        code = codes[i]
+        if not mask[i] or code < 0:
+            continue
+        sizes[code] += 1
+        value = values[i]
+        if not np.isnan(value):
+            sums[code] += value
+            counts[code] += 1
+    return sums, counts, sizes
+
+def _groupby_sum_count_masked_numpy(codes, values, mask, ngroups):
+    """Vectorized equivalent of _groupby_sum_count_masked_loop for when numba is not installed."""
+    present = mask & (codes >= 0)
+    valid = present & ~np.isnan(values)
+    sums = np.bincount(codes[valid], weights=values[valid], minlength=ngroups)
+    counts = np.bincount(codes[valid], minlength=ngroups)
+    sizes = np.bincount(codes[present], minlength=ngroups)
+    return sums, counts, sizes
+
+if njit is not None:
+    # cache=True keeps the compiled kernels on disk across restarts
+    groupby_sum_count = njit(cache=True)(_groupby_sum_count_loop)
+    groupby_sum_count_masked = njit(cache=True)(_groupby_sum_count_masked_loop)
+else:
+    groupby_sum_count = _groupby_sum_count_numpy
+    groupby_sum_count_masked = _groupby_sum_count_masked_numpy
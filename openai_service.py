@@ -1,13 +1,140 @@
 import json
+import logging
 import os
 import re
+import threading
+from collections import OrderedDict
+import numpy as np
 from openai import OpenAI
+from data_loader import BASE_DIR
+from semantic_cache import SemanticCache, normalize
+
+try:
+    from sentence_transformers import SentenceTransformer
+except ImportError:
+    SentenceTransformer = None
 
 # the newest OpenAI model is "gpt-4o" which was released May 13, 2024.
 # do not change this unless explicitly requested by the user
 OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
 openai = OpenAI(api_key=OPENAI_API_KEY) if OPENAI_API_KEY else None
 
+# Paraphrased queries reuse previously generated code instead of calling GPT-4o
+EMBEDDING_MODEL = "text-embedding-3-small"
+LOCAL_EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+semantic_cache = SemanticCache(os.environ.get("SEMANTIC_CACHE_PATH", os.path.join(BASE_DIR, "semantic_cache.npz")))
+local_embedder = None
+
+def embed_query(query):
+    """
+    Return a normalized embedding for the query.
+    Prefers a local sentence-transformers model, falling back to OpenAI embeddings.
+    """
+    global local_embedder
+    if SentenceTransformer is not None:
+        if local_embedder is None:
+            local_embedder = SentenceTransformer(LOCAL_EMBEDDING_MODEL)
+        return normalize(local_embedder.encode(query))
+    
+    response = openai.embeddings.create(model=EMBEDDING_MODEL, input=query)
+    return normalize(response.data[0].embedding)
+
+# Common query patterns and their pandas code
+QUERY_PATTERNS = [
+    # Sales by region
+    {
+        'id': 'sales_by_region',
+        'keywords': ['sales', 'by', 'region'],
+        'code': 'result = df.groupby("region", observed=True)["sales"].sum().reset_index()',
+        'description': 'Total sales by region'
+    },
+    # Sales by month
+    {
+        'id': 'sales_by_month',
+        'keywords': ['sales', 'month', 'by'],
+        'code': 'result = df.groupby("_period_M")["sales"].sum().reset_index().rename(columns={"_period_M": "date"})\nresult["date"] = result["date"].astype(str)',
+        'description': 'Sales by month'
+    },
+    # Average sales by region
+    {
+        'id': 'average_sales_by_region',
+        'keywords': ['average', 'sales', 'region'],
+        'code': 'result = df.groupby("region", observed=True)["sales"].mean().reset_index()',
+        'description': 'Average sales by region'
+    },
+    # Top/highest sales
+    {
+        'id': 'top_sales',
+        'keywords': ['top', 'highest', 'sales'],
+        'code': 'result = df.nlargest(10, "sales")[["date", "region", "sales"]]',
+        'description': 'Top 10 highest sales'
+    },
+    # Sales in specific month (July)
+    {
+        'id': 'sales_in_july',
+        'keywords': ['sales', 'july'],
+        'code': 'result = df[df["_month"] == 7]',
+        'description': 'Sales in July'
+    },
+    # Sales in specific year
+    {
+        'id': 'sales_in_2023',
+        'keywords': ['sales', '2023'],
+        'code': 'result = df[df["_year"] == 2023]',
+        'description': 'Sales in 2023'
+    },
+    # Total sales
+    {
+        'id': 'total_sales',
+        'keywords': ['total', 'sales'],
+        'code': 'result = df["sales"].sum()',
+        'description': 'Total sales'
+    },
+    # Sales trends; same code as sales by month, so it shares that template id and handler
+    {
+        'id': 'sales_trend',
+        'keywords': ['trend', 'sales'],
+        'code': 'result = df.groupby("_period_M")["sales"].sum().reset_index().rename(columns={"_period_M": "date"})\nresult["date"] = result["date"].astype(str)',
+        'description': 'Sales trends over time'
+    },
+    # Count of records
+    {
+        'id': 'record_count',
+        'keywords': ['count', 'records'],
+        'code': 'result = len(df)',
+        'description': 'Total number of records'
+    },
+    # Average daily sales
+    {
+        'id': 'average_daily_sales',
+        'keywords': ['average', 'daily', 'sales'],
+        'code': 'result = df.groupby("date")["sales"].sum().mean()',
+        'description': 'Average daily sales'
+    },
+    # Sales by region within a year
+    {
+        'id': 'sales_by_region_2023',
+        'keywords': ['sales', 'by', 'region', '2023'],
+        'code': 'result = df[df["_year"] == 2023].groupby("region", observed=True)["sales"].sum().reset_index()',
+        'description': 'Total sales by region in 2023'
+    }
+]
+
+# Default fallback - show basic dataset info
+FALLBACK_CODE = 'result = df.head(10)'
+
+# Pattern x keyword incidence matrix, so scoring every pattern is one matrix-vector product
+PATTERN_KEYWORDS = sorted({keyword for pattern in QUERY_PATTERNS for keyword in pattern['keywords']})
+PATTERN_MATRIX = np.zeros((len(QUERY_PATTERNS), len(PATTERN_KEYWORDS)), dtype=np.int32)
+for i, pattern in enumerate(QUERY_PATTERNS):
+    for keyword in pattern['keywords']:
+        PATTERN_MATRIX[i, PATTERN_KEYWORDS.index(keyword)] += 1
+
+# Template code -> pattern id, so callers can recognise vetted template code
+TEMPLATE_IDS = {FALLBACK_CODE: 'preview'}
+for pattern in QUERY_PATTERNS:
+    TEMPLATE_IDS.setdefault(pattern['code'], pattern['id'])
+
 def parse_query_locally(query, columns):
     """
     Local query parser that converts natural language to pandas code.
@@ -15,95 +142,68 @@ def parse_query_locally(query, columns):
     """
     query_lower = query.lower().strip()
     
-    # Common query patterns and their pandas code
-    patterns = [
-        # Sales by region
-        {
-            'keywords': ['sales', 'by', 'region'],
-            'code': 'result = df.groupby("region")["sales"].sum().reset_index()',
-            'description': 'Total sales by region'
-        },
-        # Sales by month
-        {
-            'keywords': ['sales', 'month', 'by'],
-            'code': 'result = df.groupby(df["date"].dt.to_period("M"))["sales"].sum().reset_index()\nresult["date"] = result["date"].astype(str)',
-            'description': 'Sales by month'
-        },
-        # Average sales by region
-        {
-            'keywords': ['average', 'sales', 'region'],
-            'code': 'result = df.groupby("region")["sales"].mean().reset_index()',
-            'description': 'Average sales by region'
-        },
-        # Top/highest sales
-        {
-            'keywords': ['top', 'highest', 'sales'],
-            'code': 'result = df.nlargest(10, "sales")[["date", "region", "sales"]]',
-            'description': 'Top 10 highest sales'
-        },
-        # Sales in specific month (July)
-        {
-            'keywords': ['sales', 'july'],
-            'code': 'result = df[df["date"].dt.month == 7]',
-            'description': 'Sales in July'
-        },
-        # Sales in specific year
-        {
-            'keywords': ['sales', '2023'],
-            'code': 'result = df[df["date"].dt.year == 2023]',
-            'description': 'Sales in 2023'
-        },
-        # Total sales
-        {
-            'keywords': ['total', 'sales'],
-            'code': 'result = df["sales"].sum()',
-            'description': 'Total sales'
-        },
-        # Sales trends
-        {
-            'keywords': ['trend', 'sales'],
-            'code': 'result = df.groupby(df["date"].dt.to_period("M"))["sales"].sum().reset_index()\nresult["date"] = result["date"].astype(str)',
-            'description': 'Sales trends over time'
-        },
-        # Count of records
-        {
-            'keywords': ['count', 'records'],
-            'code': 'result = len(df)',
-            'description': 'Total number of records'
-        },
-        # Average daily sales
-        {
-            'keywords': ['average', 'daily', 'sales'],
-            'code': 'result = df.groupby("date")["sales"].sum().mean()',
-            'description': 'Average daily sales'
-        }
-    ]
-    
-    # Find best matching pattern
-    best_match = None
-    max_matches = 0
+    # Find best matching pattern: each distinct keyword is tested once, then all
+    # patterns are scored together; argmax keeps the first pattern on ties
+    present = np.fromiter((keyword in query_lower for keyword in PATTERN_KEYWORDS),
+                          dtype=np.int32, count=len(PATTERN_KEYWORDS))
+    scores = PATTERN_MATRIX @ present
+    best = int(scores.argmax())
     
-    for pattern in patterns:
-        matches = sum(1 for keyword in pattern['keywords'] if keyword in query_lower)
-        if matches > max_matches and matches > 0:
-            max_matches = matches
-            best_match = pattern
-    
-    if best_match:
-        return best_match['code'], None
+    if scores[best] > 0:
+        return QUERY_PATTERNS[best]['code'], None
     
     # Default fallback - show basic dataset info
-    return 'result = df.head(10)', None
+    return FALLBACK_CODE, None
+
+# Generated code keyed on (query, columns), least recently used first
+CODE_CACHE_SIZE = 1024
+code_cache = OrderedDict()
+code_cache_lock = threading.Lock()
 
 def generate_pandas_code(query, columns):
     """
     Convert natural language query into pandas code.
     Uses OpenAI GPT-4o if available, otherwise falls back to local parser.
     Returns the generated code and any error message.
+    Identical queries (ignoring surrounding whitespace) are served from cache.
+    Case is kept in the key, since data values such as region names are case-sensitive.
+    """
+    query = query.strip()
+    key = (query, tuple(columns))
+    with code_cache_lock:
+        if key in code_cache:
+            code_cache.move_to_end(key)
+            return code_cache[key], None
+    
+    code, error, cacheable = generate_pandas_code_uncached(query, list(columns))
+    if not cacheable:
+        return code, error
+    
+    with code_cache_lock:
+        code_cache[key] = code
+        code_cache.move_to_end(key)
+        if len(code_cache) > CODE_CACHE_SIZE:
+            code_cache.popitem(last=False)
+    return code, error
+
+def generate_pandas_code_uncached(query, columns):
+    """
+    Body of generate_pandas_code without the exact-match cache.
+    Returns (code, error, cacheable); errors and local-parser fallbacks after an
+    OpenAI failure are not cacheable, so a transient outage is not remembered.
     """
     # If OpenAI API is not available, use local parser
     if not openai or not OPENAI_API_KEY:
-        return parse_query_locally(query, columns)
+        return (*parse_query_locally(query, columns), True)
+    
+    try:
+        embedding = embed_query(query)
+        cached_code = semantic_cache.lookup(embedding, columns)
+        if cached_code is not None:
+            return cached_code, None, True
+    except Exception as e:
+        logging.warning(f"Semantic cache lookup failed: {e}")
+        embedding = None
     
     try:
         system_prompt = f"""You are an expert data analyst. Convert natural language queries into pandas code.
@@ -151,14 +251,17 @@ Respond with JSON containing the pandas code:
         
         content = response.choices[0].message.content
         if content is None:
-            return None, "OpenAI response content is empty"
+            return None, "OpenAI response content is empty", False
         result = json.loads(content)
         
         if 'code' not in result:
-            return None, "OpenAI response does not contain 'code' field"
+            return None, "OpenAI response does not contain 'code' field", False
+        
+        if embedding is not None:
+            semantic_cache.add(embedding, query, result['code'], columns)
         
-        return result['code'], None
+        return result['code'], None, True
         
     except Exception as e:
         # Fallback to local parser if OpenAI fails
-        return parse_query_locally(query, columns)
+        return (*parse_query_locally(query, columns), False)
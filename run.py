@@ -4,7 +4,10 @@ Data Query Analytics Dashboard
 Main entry point for the application
 """
 
+import os
+
 from app import app
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
+    # Debugger and reloader only in development; use gunicorn.conf.py in production
+    app.run(host='0.0.0.0', port=5000, debug=os.environ.get('FLASK_ENV') == 'development')
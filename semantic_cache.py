@@ -0,0 +1,138 @@
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+
+
+class SemanticCache:
+    """
+    Cache of generated pandas code keyed on query embeddings.
+    Paraphrased queries ("total sales by region", "sum sales grouped by region")
+    land on the same entry when their cosine similarity exceeds the threshold.
+    """
+
+    def __init__(self, path=None, threshold=0.92, capacity=4096, flush_interval=30):
+        self.path = path
+        self.threshold = threshold
+        self.capacity = capacity
+        self.flush_interval = flush_interval
+        self.embeddings = None
+        self.entries = []
+        self.columns = None
+        # Entries are persisted off the request path: version counts additions,
+        # saved_version is the last one written by flush()
+        self.version = 0
+        self.saved_version = 0
+        self.flusher_pid = None
+        self._lock = threading.Lock()
+        # Held for a whole flush, so the periodic thread and the atexit hook never
+        # write the same temp file at once; _lock is released during the file I/O
+        self._flush_lock = threading.Lock()
+        if path:
+            self.embeddings, self.entries, self.columns = self.read() or (None, [], None)
+            atexit.register(self.flush)
+
+    def lookup(self, embedding, columns):
+        """Return cached code for the closest stored query, or None."""
+        with self._lock:
+            if self.embeddings is None or list(columns) != self.columns:
+                return None
+            if self.embeddings.shape[1] != embedding.shape[0]:
+                return None
+            sims = self.embeddings @ embedding
+            best = int(np.argmax(sims))
+            if sims[best] > self.threshold:
+                return self.entries[best]['code']
+        return None
+
+    def add(self, embedding, query, code, columns):
+        """Store generated code under the query embedding; written to disk by flush()."""
+        with self._lock:
+            if list(columns) != self.columns or (
+                    self.embeddings is not None and self.embeddings.shape[1] != embedding.shape[0]):
+                # Cached code is only valid for the schema and embedder it was stored with
+                self.embeddings = None
+                self.entries = []
+                self.columns = list(columns)
+            row = embedding.astype(np.float32).reshape(1, -1)
+            if self.embeddings is None:
+                self.embeddings = row
+            else:
+                self.embeddings = np.vstack([self.embeddings, row])[-self.capacity:]
+            self.entries.append({'query': query, 'code': code})
+            self.entries = self.entries[-self.capacity:]
+            self.version += 1
+        if self.path:
+            self.start_flusher()
+
+    def start_flusher(self):
+        """Start the periodic flush thread once per process (forked workers each get one)."""
+        with self._lock:
+            if self.flusher_pid == os.getpid():
+                return
+            self.flusher_pid = os.getpid()
+        threading.Thread(target=self.flush_periodically, name='semantic-cache-flush', daemon=True).start()
+
+    def flush_periodically(self):
+        """Flush new entries every flush_interval seconds."""
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def read(self):
+        """Return (embeddings, entries, columns) stored on disk, or None."""
+        if not os.path.exists(self.path):
+            return None
+        try:
+            with np.load(self.path) as stored:
+                embeddings = stored['embeddings'].astype(np.float32)
+                meta = json.loads(str(stored['meta']))
+            if len(meta['entries']) != len(embeddings):
+                return None
+            return embeddings, meta['entries'], meta['columns']
+        except Exception as e:
+            logging.warning(f"Failed to load semantic cache from {self.path}: {e}")
+            return None
+
+    def flush(self):
+        """
+        Write new entries to disk if there are any.
+        Entries saved by other worker processes are merged in rather than overwritten,
+        and the file is replaced atomically so readers never see a partial write.
+        """
+        with self._flush_lock:
+            with self._lock:
+                if self.version == self.saved_version or self.embeddings is None:
+                    return
+                version = self.version
+                embeddings, entries, columns = self.embeddings, list(self.entries), self.columns
+
+            stored = self.read()
+            if stored and stored[2] == columns and stored[0].shape[1] == embeddings.shape[1]:
+                known = {entry['query'] for entry in entries}
+                keep = [i for i, entry in enumerate(stored[1]) if entry['query'] not in known]
+                embeddings = np.vstack([stored[0][keep], embeddings])[-self.capacity:]
+                entries = ([stored[1][i] for i in keep] + entries)[-self.capacity:]
+
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            try:
+                with open(tmp_path, 'wb') as f:
+                    np.savez(f, embeddings=embeddings,
+                             meta=np.array(json.dumps({'columns': columns, 'entries': entries})))
+                os.replace(tmp_path, self.path)
+            except Exception as e:
+                logging.warning(f"Failed to save semantic cache to {self.path}: {e}")
+                return
+            with self._lock:
+                self.saved_version = max(self.saved_version, version)
+
+
+def normalize(vector):
+    """Return the L2-normalized float32 copy of an embedding vector."""
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
@@ -0,0 +1,109 @@
+import os
+
+import pytest
+
+from app import data_columns, execute_pandas_code, sales_data
+from data_loader import DERIVED_COLUMNS
+
+
+def run(code):
+    return execute_pandas_code(code, sales_data)
+
+
+@pytest.mark.parametrize('code', [
+    "result = df.groupby('region')['sales'].sum().reset_index()",
+    "result = df[(df['date'].dt.year == 2023) & (df['date'].dt.month == 7)]",
+    "monthly = df.groupby(df['date'].dt.to_period('M'))['sales'].mean().reset_index()\n"
+    "monthly['date'] = monthly['date'].astype(str)\nresult = monthly",
+    "result = df['sales'].apply(lambda x: round(x, 1)).sum()",
+    "result = [r for r in df['region'].unique()]",
+    "result = len(df[df['date'] > datetime.datetime(2023, 6, 1)])",
+])
+def test_ordinary_pandas_code_runs(code):
+    result, error = run(code)
+    assert error is None
+    assert result is not None
+
+
+@pytest.mark.parametrize('code', [
+    "result = df.mean(numeric_only=True)",
+    "result = df.dtypes",
+    "result = list(df.columns)",
+])
+def test_helper_columns_are_hidden(code):
+    result, error = run(code)
+    assert error is None
+    assert not any(name in str(result['data']) for name in DERIVED_COLUMNS)
+
+
+def test_column_count_matches_prompt():
+    result, error = run("result = df.shape[1]")
+    assert result['data'] == len(data_columns)
+
+
+@pytest.mark.parametrize('code', [
+    "import os\nresult = 1",
+    "result = __import__('os')",
+    "result = eval('1+1')",
+    "result = open('/etc/hostname').read()",
+    "result = getattr(df, 'shape')",
+    "result = df.__class__",
+    "result = ().__class__.__bases__[0].__subclasses__()",
+    "result = pd.io.common.os.system('true')",
+    "result = pd.read_pickle('x')",
+    "result = '{0.__class__}'.format(df)",
+    "result = df.agg('__class__')",
+    "def f():\n    pass\nresult = 1",
+])
+def test_unsafe_code_is_rejected(code):
+    result, error = run(code)
+    assert result is None
+    assert error.startswith('Generated code contains unsafe operations')
+
+
+@pytest.mark.parametrize('template', [
+    "result = pd.eval(\"pd.io.common.os.system('touch {path}')\")",
+    "result = df.eval(\"@pd.io.common.os.system('touch {path}')\")",
+    "result = df.query(\"@pd.io.common.os.system('touch {path}') == 0\")",
+    "result = df.agg('eval', expr=\"@pd.io.common.os.system('touch {path}')\")",
+    "result = df.apply('query', expr=\"@pd.io.common.os.system('touch {path}') == 0\")",
+])
+def test_string_expressions_are_rejected(tmp_path, template):
+    path = str(tmp_path / 'pwn')
+    result, error = run(template.format(path=path))
+    assert result is None
+    assert error.startswith('Generated code contains unsafe operations')
+    assert not os.path.exists(path)
+
+
+@pytest.mark.parametrize('code', [
+    "if False:\n    eval = None\nresult = eval('1+1')",
+    "if False:\n    open = None\nresult = open('/etc/hostname').read()",
+    "if False:\n    __import__ = None\nresult = 1",
+])
+def test_names_bound_in_dead_branches_do_not_reach_builtins(code):
+    result, error = run(code)
+    assert result is None
+    assert error is not None
+
+
+@pytest.mark.parametrize('template', [
+    "df['sales'].to_numpy().tofile({path!r})\nresult = 1",
+    "df['sales'].to_numpy().dump({path!r})\nresult = 1",
+    "df.to_string({path!r})\nresult = 1",
+    "df.to_csv({path!r})\nresult = 1",
+    "store = pd.HDFStore({path!r})\nresult = 1",
+    "writer = pd.ExcelWriter({path!r})\nresult = 1",
+    "df.style.to_html({path!r})\nresult = 1",
+    "df.agg('to_pickle', path={path!r})\nresult = 1",
+    "df.apply('to_pickle', path={path!r})\nresult = 1",
+    "df['sales'].agg('to_pickle', path={path!r})\nresult = 1",
+    "df.groupby('region').agg('to_pickle', path={path!r})\nresult = 1",
+    "pd.show_versions(as_json={path!r})\nresult = 1",
+])
+def test_file_writes_are_rejected(tmp_path, template):
+    path = str(tmp_path / 'out')
+    result, error = run(template.format(path=path))
+    assert result is None
+    assert error.startswith('Generated code contains unsafe operations')
+    assert not os.path.exists(path)
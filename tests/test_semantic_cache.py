@@ -0,0 +1,77 @@
+import threading
+
+import numpy as np
+
+from semantic_cache import SemanticCache, normalize
+
+COLUMNS = ['date', 'region', 'sales']
+
+
+def unit(i, dim=8):
+    """Embedding orthogonal to every other unit(j)."""
+    vector = np.zeros(dim, dtype=np.float32)
+    vector[i] = 1
+    return vector
+
+
+def test_lookup_returns_code_of_similar_query():
+    cache = SemanticCache()
+    cache.add(unit(0), 'total sales by region', 'code 0', COLUMNS)
+    near = normalize(unit(0) + 0.1 * unit(1))
+    assert cache.lookup(near, COLUMNS) == 'code 0'
+    assert cache.lookup(unit(1), COLUMNS) is None
+
+
+def test_lookup_misses_on_other_columns_or_dimension():
+    cache = SemanticCache()
+    cache.add(unit(0), 'total sales', 'code 0', COLUMNS)
+    assert cache.lookup(unit(0), ['date', 'sales']) is None
+    assert cache.lookup(unit(0, dim=4), COLUMNS) is None
+
+
+def test_capacity_keeps_newest_entries():
+    cache = SemanticCache(capacity=3)
+    for i in range(5):
+        cache.add(unit(i), f'query {i}', f'code {i}', COLUMNS)
+    assert len(cache.entries) == len(cache.embeddings) == 3
+    assert cache.lookup(unit(1), COLUMNS) is None
+    assert cache.lookup(unit(4), COLUMNS) == 'code 4'
+
+
+def test_flush_round_trip(tmp_path):
+    path = str(tmp_path / 'cache.npz')
+    cache = SemanticCache(path)
+    cache.add(unit(0), 'query 0', 'code 0', COLUMNS)
+    cache.flush()
+    assert SemanticCache(path).lookup(unit(0), COLUMNS) == 'code 0'
+
+
+def test_flush_merges_entries_saved_by_other_processes(tmp_path):
+    path = str(tmp_path / 'cache.npz')
+    first, second = SemanticCache(path), SemanticCache(path)
+    first.add(unit(0), 'query 0', 'code 0', COLUMNS)
+    second.add(unit(1), 'query 1', 'code 1', COLUMNS)
+    first.flush()
+    second.flush()
+    stored = SemanticCache(path)
+    assert stored.lookup(unit(0), COLUMNS) == 'code 0'
+    assert stored.lookup(unit(1), COLUMNS) == 'code 1'
+
+
+def test_concurrent_flushes_leave_a_readable_file(tmp_path):
+    path = str(tmp_path / 'cache.npz')
+    cache = SemanticCache(path)
+
+    def add_and_flush(offset):
+        for i in range(offset, offset + 20):
+            cache.add(unit(i, dim=64), f'query {i}', f'code {i}', COLUMNS)
+            cache.flush()
+
+    threads = [threading.Thread(target=add_and_flush, args=(offset,)) for offset in (0, 20, 40)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    cache.flush()
+    assert SemanticCache(path).read() is not None
+    assert len(SemanticCache(path).entries) == 60
@@ -0,0 +1,32 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from app import TEMPLATE_HANDLERS, dumps, sales_data, serialize_result
+from openai_service import FALLBACK_CODE, QUERY_PATTERNS, TEMPLATE_IDS
+
+
+def with_nan_sales(df):
+    """Copy of the data where one region has only NaN sales and others have some."""
+    df = df.copy()
+    df.loc[df['region'] == df['region'].cat.categories[0], 'sales'] = np.nan
+    df.loc[df.index[::7], 'sales'] = np.nan
+    return df
+
+
+FRAMES = {'sales': sales_data, 'nan_sales': with_nan_sales(sales_data)}
+TEMPLATES = [pattern['code'] for pattern in QUERY_PATTERNS] + [FALLBACK_CODE]
+
+
+@pytest.mark.parametrize('frame', FRAMES)
+@pytest.mark.parametrize('code', TEMPLATES, ids=[TEMPLATE_IDS[code] for code in TEMPLATES])
+def test_handler_matches_template_code(code, frame):
+    df = FRAMES[frame]
+    namespace = {'df': df, 'pd': pd}
+    exec(code, namespace)
+    handler = TEMPLATE_HANDLERS[TEMPLATE_IDS[code]]
+    assert dumps(serialize_result(handler(df))) == dumps(serialize_result(namespace['result']))
+
+
+def test_every_handler_is_reachable():
+    assert set(TEMPLATE_HANDLERS) == set(TEMPLATE_IDS.values())